@@ -5,24 +5,90 @@
 提供RESTful API接口
 """
 from flask_cors import CORS # 导入 CORS
-from flask import Flask, jsonify, request
+from flask import Flask, request
 from flask_cors import CORS
+import os
+import re
 import socket
+import struct
+import selectors
+import errno
 import ipaddress
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
+from collections import deque
+from dataclasses import dataclass, field, asdict
+from functools import lru_cache
+import sys
+import atexit
+import logging
+from logging.handlers import QueueHandler, QueueListener
 import threading
+import heapq
+import queue
 import uuid
 import time
-import requests
+import orjson
+import urllib3
+from urllib3.exceptions import MaxRetryError, NewConnectionError, ProtocolError, ProxyError, SSLError
+from urllib3.exceptions import TimeoutError as HTTPTimeoutError
 
 app = Flask(__name__)
 CORS(app)
 
+# 日志: 工作线程只把日志放入队列, 由单独的监听线程输出, 避免多线程争用 stdout
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+logger.propagate = False
+log_queue = queue.Queue(-1)
+logger.addHandler(QueueHandler(log_queue))
+log_listener = QueueListener(log_queue, logging.StreamHandler(sys.stdout))
+log_listener.start()
+atexit.register(log_listener.stop)
+
 # 使用字典存储多个扫描任务
+# 读取不加锁 (CPython 中 dict 的单次读取是原子的), 只有增删任务时持有 tasks_lock
 scan_tasks = {}
-# 任务清理线程锁
+# 任务增删锁
 tasks_lock = threading.Lock()
+# 任务过期时间堆 [(过期时间, task_id)], 任务创建1小时后清理
+task_expiry = []
+TASK_TTL = 3600
+# 到期时仍在扫描的任务, 间隔多久后再检查
+TASK_RECHECK_INTERVAL = 60
+# 开放端口处理线程池 (生成结果 + 代理质量检测, 所有任务共享, 避免每个任务重复创建线程)
+# 任务以等待网络为主, 线程数按CPU核数放大
+scan_executor = ThreadPoolExecutor(
+    max_workers=max(50, min(1024, (os.cpu_count() or 1) * 32)),
+    thread_name_prefix='scan'
+)
+# 代理检测的HTTP探测线程池 (各站点并发请求, 所有任务共享; AI端点使用 AIProbeDispatcher 各自的线程池)
+probe_executor = ThreadPoolExecutor(max_workers=64, thread_name_prefix='probe')
+# 所有任务同时在途的TCP连接总数上限, 防止文件描述符耗尽
+connect_slots = threading.BoundedSemaphore(2048)
+
+# 直连HTTP连接池 (查询地理位置等不经过代理的请求), 直接使用 urllib3, 省去 requests 的封装开销
+http_pool = urllib3.PoolManager(num_pools=128, maxsize=256, cert_reqs='CERT_NONE')
+# 探测AI端点时跟随重定向, 但连接/读取失败不重试
+FOLLOW_REDIRECTS = urllib3.Retry(total=5, connect=0, read=0, status=0, other=0, redirect=5)
+# 检测时使用 verify=False, 关闭每次请求都会格式化输出的证书警告
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+
+def format_timestamp(ts):
+    """将 time.time() 时间戳格式化为 'YYYY-MM-DD HH:MM:SS'"""
+    if ts is None:
+        return None
+    return datetime.fromtimestamp(ts).isoformat(sep=' ', timespec='seconds')
+
+
+# 任务JSON缓存的最短刷新间隔 (秒), 即每个任务最多每秒序列化10次
+JSON_REFRESH_INTERVAL = 0.1
+
+
+def json_response(data):
+    """使用 orjson 序列化的JSON响应"""
+    return app.response_class(orjson.dumps(data), mimetype='application/json')
 
 
 class ScanTask:
@@ -31,6 +97,8 @@ class ScanTask:
     def __init__(self, task_id, network, port, threads, check_proxy_quality=False):
         self.task_id = task_id
         self.network = network
+        # 创建任务时解析一次网络地址 (同时完成校验), 扫描线程直接使用
+        self.network_obj = ipaddress.ip_network(network, strict=False)
         self.port = port
         self.threads = threads
         self.check_proxy_quality = check_proxy_quality
@@ -42,7 +110,29 @@ class ScanTask:
         self.start_time = None
         self.end_time = None
         self.error = None
-        self.created_at = datetime.now()
+        # 时间均以 time.time() 存储, 仅在输出时格式化
+        self.created_at = time.time()
+        # 序列化结果缓存, 任务状态变化时由 touch() 标记失效
+        self._json = None
+        self._json_time = 0.0
+        self._dirty = True
+
+    def touch(self):
+        """标记任务状态已变化"""
+        self._dirty = True
+
+    def to_json(self):
+        """
+        序列化为JSON字节串
+        未变化时直接返回缓存; 扫描中频繁变化时最多每 JSON_REFRESH_INTERVAL 秒重新序列化一次
+        """
+        now = time.monotonic()
+        if self._json is None or (self._dirty and now - self._json_time >= JSON_REFRESH_INTERVAL):
+            # 先清除标记再序列化, 序列化期间的修改会在下次调用时重新生成
+            self._dirty = False
+            self._json_time = now
+            self._json = orjson.dumps(self.to_dict())
+        return self._json
 
     def to_dict(self):
         """转换为字典"""
@@ -56,254 +146,374 @@ class ScanTask:
             'progress': self.progress,
             'total': self.total,
             'scanned': self.scanned,
-            'results': self.results,
-            'start_time': self.start_time,
-            'end_time': self.end_time,
+            'results': self.formatted_results(),
+            'start_time': format_timestamp(self.start_time),
+            'end_time': format_timestamp(self.end_time),
             'error': self.error,
-            'created_at': self.created_at.strftime('%Y-%m-%d %H:%M:%S')
+            'created_at': format_timestamp(self.created_at)
         }
 
-
-def test_ai_model_availability(proxies, timeout=8):
+    def formatted_results(self):
+        """扫描结果 (发现时间格式化为字符串)"""
+        return [dict(result, timestamp=format_timestamp(result['timestamp'])) for result in self.results]
+
+
+# 各个AI模型的测试端点
+AI_ENDPOINTS = (
+    {
+        'name': 'chatgpt',
+        'url': 'https://chat.openai.com',
+        'display_name': 'ChatGPT',
+        'check_pattern': re.compile('openai', re.I)  # 检查响应中是否包含关键字
+    },
+    {
+        'name': 'claude',
+        'url': 'https://claude.ai',
+        'display_name': 'Claude',
+        'check_pattern': re.compile('claude', re.I)
+    },
+    {
+        'name': 'gemini',
+        'url': 'https://gemini.google.com',
+        'display_name': 'Gemini',
+        'check_pattern': re.compile('google', re.I)
+    },
+    {
+        'name': 'copilot',
+        'url': 'https://copilot.microsoft.com',
+        'display_name': 'Copilot',
+        'check_pattern': re.compile('microsoft', re.I)
+    },
+)
+
+# 常见的地区限制关键词 (预编译为一个忽略大小写的正则, 一次扫描页面)
+BLOCKED_PATTERN = re.compile(
+    r'not available in your (?:country|region)'
+    r'|service is not available'
+    r'|access denied'
+    r'|region restricted'
+    r'|geographic restriction'
+    r'|geoblocked'
+    r'|vpn detected'
+    r'|proxy detected',
+    re.I
+)
+
+
+@lru_cache(maxsize=128)
+def _proxy_manager(proxy_url):
     """
-    测试主流AI模型的可用性
-    检测 ChatGPT, Claude, Gemini 等模型是否可访问
+    获取代理对应的连接池管理器 (按代理地址缓存)
+    同一代理上的多个站点复用连接, 无需重复TCP/TLS握手
     """
-    ai_availability = {
-        'chatgpt': {'available': False, 'status': 'unknown', 'response_time': None},
-        'claude': {'available': False, 'status': 'unknown', 'response_time': None},
-        'gemini': {'available': False, 'status': 'unknown', 'response_time': None},
-        'copilot': {'available': False, 'status': 'unknown', 'response_time': None},
-    }
+    if proxy_url.startswith('socks'):
+        # 需要 PySocks, 延迟导入: 未安装时只影响SOCKS5检测
+        from urllib3.contrib.socks import SOCKSProxyManager
+        return SOCKSProxyManager(proxy_url, num_pools=16, maxsize=4, cert_reqs='CERT_NONE')
+    return urllib3.ProxyManager(proxy_url, num_pools=16, maxsize=4, cert_reqs='CERT_NONE')
 
-    # 各个AI模型的测试端点
-    ai_endpoints = [
-        {
-            'name': 'chatgpt',
-            'url': 'https://chat.openai.com',
-            'display_name': 'ChatGPT',
-            'check_text': 'openai'  # 检查响应中是否包含关键字
-        },
-        {
-            'name': 'claude',
-            'url': 'https://claude.ai',
-            'display_name': 'Claude',
-            'check_text': 'claude'
-        },
-        {
-            'name': 'gemini',
-            'url': 'https://gemini.google.com',
-            'display_name': 'Gemini',
-            'check_text': 'google'
-        },
-        {
-            'name': 'copilot',
-            'url': 'https://copilot.microsoft.com',
-            'display_name': 'Copilot',
-            'check_text': 'microsoft'
-        },
-    ]
 
-    for endpoint in ai_endpoints:
+def http_get(url, proxy_url=None, timeout=8, follow_redirects=False, user_agent=None):
+    """
+    发送GET请求 (不预读响应体), 失败时抛出 urllib3 的原始异常
+    调用方读取完响应后需调用 release_response()
+    """
+    manager = _proxy_manager(proxy_url) if proxy_url else http_pool
+    headers = {'User-Agent': user_agent} if user_agent else None
+    try:
+        return manager.request(
+            'GET', url,
+            headers=headers,
+            timeout=urllib3.Timeout(connect=timeout, read=timeout),
+            retries=FOLLOW_REDIRECTS if follow_redirects else False,
+            redirect=follow_redirects,
+            preload_content=False
+        )
+    except MaxRetryError as e:
+        if e.reason is None:
+            raise
+        raise e.reason from e
+
+
+def release_response(response, read_all=False):
+    """释放响应连接: 已读完的连接放回连接池, 未读完的直接关闭"""
+    if not read_all:
+        response.close()
+    response.release_conn()
+
+
+def _read_head(response, limit=65536):
+    """读取响应体的前 limit 字节并解码, 避免整页下载大型页面"""
+    return response.read(limit).decode('utf-8', errors='ignore')
+
+
+def _probe_ai_endpoint(endpoint, proxy_url, timeout):
+    """探测单个AI模型端点, 返回该模型的可用性信息"""
+    info = {'available': False, 'status': 'unknown', 'response_time': None}
+    try:
+        start_time = time.time()
+        response = http_get(
+            endpoint['url'],
+            proxy_url,
+            timeout=timeout,
+            follow_redirects=True,
+            user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+        )
         try:
-            start_time = time.time()
-            response = requests.get(
-                endpoint['url'],
-                proxies=proxies,
-                timeout=timeout,
-                verify=False,
-                allow_redirects=True,
-                headers={
-                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
-                }
-            )
             elapsed = time.time() - start_time
 
             # 判断是否可访问
-            if response.status_code in [200, 301, 302]:
-                # 检查是否被重定向到错误页面或地区限制页面
-                content_lower = response.text.lower()
-
-                # 常见的地区限制关键词
-                blocked_keywords = [
-                    'not available in your country',
-                    'not available in your region',
-                    'service is not available',
-                    'access denied',
-                    'region restricted',
-                    'geographic restriction',
-                    'geoblocked',
-                    'vpn detected',
-                    'proxy detected'
-                ]
-
-                is_blocked = any(keyword in content_lower for keyword in blocked_keywords)
+            if response.status in [200, 301, 302]:
+                # 检查是否被重定向到错误页面或地区限制页面 (只读取页面开头部分)
+                content = _read_head(response)
+                is_blocked = BLOCKED_PATTERN.search(content) is not None
 
                 if is_blocked:
-                    ai_availability[endpoint['name']]['available'] = False
-                    ai_availability[endpoint['name']]['status'] = 'blocked'
-                elif endpoint['check_text'] in content_lower or response.status_code == 200:
-                    ai_availability[endpoint['name']]['available'] = True
-                    ai_availability[endpoint['name']]['status'] = 'available'
-                    ai_availability[endpoint['name']]['response_time'] = round(elapsed * 1000, 2)
+                    info['available'] = False
+                    info['status'] = 'blocked'
+                elif endpoint['check_pattern'].search(content) or response.status == 200:
+                    info['available'] = True
+                    info['status'] = 'available'
+                    info['response_time'] = round(elapsed * 1000, 2)
                 else:
-                    ai_availability[endpoint['name']]['status'] = 'uncertain'
+                    info['status'] = 'uncertain'
 
-            elif response.status_code == 403:
-                ai_availability[endpoint['name']]['available'] = False
-                ai_availability[endpoint['name']]['status'] = 'blocked'
+            elif response.status == 403:
+                info['available'] = False
+                info['status'] = 'blocked'
             else:
-                ai_availability[endpoint['name']]['status'] = f'http_{response.status_code}'
+                info['status'] = f'http_{response.status}'
+        finally:
+            release_response(response)
+
+    except NewConnectionError:
+        info['status'] = 'connection_error'
+    except HTTPTimeoutError:
+        info['status'] = 'timeout'
+    except (ProxyError, SSLError, ProtocolError):
+        info['status'] = 'connection_error'
+    except Exception as e:
+        info['status'] = 'error'
+
+    return info
+
 
-        except requests.exceptions.Timeout:
-            ai_availability[endpoint['name']]['status'] = 'timeout'
-        except requests.exceptions.ConnectionError:
-            ai_availability[endpoint['name']]['status'] = 'connection_error'
-        except Exception as e:
-            ai_availability[endpoint['name']]['status'] = 'error'
+class AIProbeDispatcher:
+    """
+    AI模型探测调度器
+    每个AI服务使用独立的小线程池, 线程数即对该服务的并发请求上限, 避免大量代理同时访问被限流;
+    某个服务响应慢时探测只在它自己的线程池中排队, 不占用共享的 probe_executor
+    """
+
+    def __init__(self, per_endpoint_limit=8):
+        self.per_endpoint_limit = per_endpoint_limit
+        self.endpoint_executors = {}
+
+    def submit(self, proxy_url, endpoint, timeout=8):
+        """提交一次探测, 返回结果为 _probe_ai_endpoint 返回值的 Future"""
+        executor = self.endpoint_executors.get(endpoint['name'])
+        if executor is None:
+            # setdefault 保证并发提交时同一服务只有一个线程池 (线程按需创建, 落选的线程池不会启动线程)
+            executor = self.endpoint_executors.setdefault(
+                endpoint['name'],
+                ThreadPoolExecutor(
+                    max_workers=self.per_endpoint_limit,
+                    thread_name_prefix=f"ai-{endpoint['name']}"
+                )
+            )
+        return executor.submit(_probe_ai_endpoint, endpoint, proxy_url, timeout)
+
+
+ai_probe_dispatcher = AIProbeDispatcher()
+
+
+def test_ai_model_availability(proxy_url, timeout=8):
+    """
+    测试主流AI模型的可用性
+    检测 ChatGPT, Claude, Gemini 等模型是否可访问
+    各端点并发探测, 总耗时约为单个端点的超时时间而非累加
+    """
+    futures = {
+        endpoint['name']: ai_probe_dispatcher.submit(proxy_url, endpoint, timeout)
+        for endpoint in AI_ENDPOINTS
+    }
+
+    ai_availability = {}
+    for name, future in futures.items():
+        ai_availability[name] = future.result()
 
     return ai_availability
 
 
+@dataclass(slots=True)
+class ProxyInfo:
+    """代理质量检测结果"""
+    response_time: float | None = None
+    is_working: bool = False
+    http_code: int | None = None
+    can_access_google: bool = False
+    accessible_sites: list = field(default_factory=list)
+    quality_score: int = 0
+    quality_level: str = 'unknown'
+    error: str | None = None
+    proxy_type: str = 'unknown'
+    exit_ip: str | None = None
+    exit_country: str | None = None
+    exit_country_code: str | None = None
+    exit_city: str | None = None
+    exit_region: str | None = None
+    ai_models: dict | None = None
+
+
+@lru_cache(maxsize=2048)
+def _geo_for_ip(exit_ip):
+    """
+    查询出口IP的地理位置 (本机直连ipapi.co, 不经过代理)
+    同一出口(如NAT后的多个代理)只查询一次, 失败不缓存
+    """
+    response = http_get(f'https://ipapi.co/{exit_ip}/json/', timeout=5)
+    try:
+        if response.status >= 400:
+            raise ValueError(f'ipapi HTTP {response.status}')
+        geo_data = orjson.loads(response.read())
+    finally:
+        release_response(response, read_all=True)
+    if geo_data.get('error'):
+        raise ValueError(geo_data.get('reason', 'ipapi lookup failed'))
+    return geo_data
+
+
+def _probe_site(site, proxy_url, timeout):
+    """
+    通过代理访问单个测试站点, 返回 (站点, HTTP状态码, 响应体, 耗时)
+    只有出口IP检测需要响应体, 其他站点不下载页面
+    """
+    start_time = time.time()
+    response = http_get(
+        site['url'],
+        proxy_url,
+        timeout=timeout,
+        user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+    )
+    elapsed = time.time() - start_time
+
+    body = None
+    try:
+        if site['key'] == 'ip_check':
+            body = response.read()
+    finally:
+        release_response(response, read_all=body is not None)
+    return site, response.status, body, elapsed
+
+
 def test_proxy_quality(ip, port, timeout=8, check_ai_models=True):
     """
     测试代理质量 - 专门测试访问外网能力
     优化速度 + 检测代理出口IP的国家 + AI模型可用性
     """
-    proxy_info = {
-        'response_time': None,
-        'is_working': False,
-        'http_code': None,
-        'can_access_google': False,
-        'accessible_sites': [],
-        'quality_score': 0,
-        'quality_level': 'unknown',
-        'error': None,
-        'proxy_type': 'unknown',
-        'exit_ip': None,
-        'exit_country': None,
-        'exit_country_code': None,
-        'exit_city': None,
-        'ai_models': None
-    }
+    proxy_info = ProxyInfo()
 
     # 测试多种代理协议
     proxy_configs = [
-        {
-            'type': 'http',
-            'proxies': {
-                'http': f'http://{ip}:{port}',
-                'https': f'http://{ip}:{port}'
-            }
-        },
-        {
-            'type': 'socks5',
-            'proxies': {
-                'http': f'socks5://{ip}:{port}',
-                'https': f'socks5://{ip}:{port}'
-            }
-        }
+        {'type': 'http', 'proxy_url': f'http://{ip}:{port}'},
+        {'type': 'socks5', 'proxy_url': f'socks5://{ip}:{port}'},
     ]
 
-    # 优化：只测试关键站点，减少测试数量
+    # 优化：只测试关键站点，减少测试数量 (并发测试)
     test_sites = [
-        {'url': 'https://ipapi.co/json/', 'name': 'IP Check', 'key': 'ip_check', 'priority': 1},  # 获取出口IP和地理位置
+        {'url': 'https://api.ipify.org?format=json', 'name': 'IP Check', 'key': 'ip_check', 'priority': 1},  # 获取出口IP
         {'url': 'https://www.google.com/generate_204', 'name': 'Google', 'key': 'can_access_google', 'priority': 2},
         {'url': 'https://www.youtube.com', 'name': 'YouTube', 'key': 'can_access_youtube', 'priority': 3},
     ]
 
     best_time = None
     successful_config = None
-    working_proxies = None
+    working_proxy_url = None
 
     # 尝试不同的代理配置
     for config in proxy_configs:
-        proxies = config['proxies']
+        proxy_url = config['proxy_url']
+
+        # 各站点并发测试, 按返回先后处理结果
+        futures = [
+            probe_executor.submit(_probe_site, site, proxy_url, timeout)
+            for site in test_sites
+        ]
 
-        # 按优先级测试
-        for site in sorted(test_sites, key=lambda x: x['priority']):
+        for future in as_completed(futures):
             try:
-                start_time = time.time()
-                response = requests.get(
-                    site['url'],
-                    proxies=proxies,
-                    timeout=timeout,
-                    allow_redirects=False,
-                    verify=False,
-                    headers={
-                        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-                    }
-                )
-                elapsed = time.time() - start_time
+                site, status, body, elapsed = future.result()
 
                 # 如果成功访问
-                if response.status_code in [200, 204, 301, 302, 403]:
-                    proxy_info['is_working'] = True
-                    proxy_info['http_code'] = response.status_code
-                    proxy_info['proxy_type'] = config['type']
-                    working_proxies = proxies
+                if status in [200, 204, 301, 302, 403]:
+                    proxy_info.is_working = True
+                    proxy_info.http_code = status
+                    proxy_info.proxy_type = config['type']
+                    working_proxy_url = proxy_url
 
                     if successful_config is None:
                         successful_config = config['type']
 
-                    # 获取出口IP和地理位置信息（使用ipapi.co）
-                    if site['key'] == 'ip_check' and response.status_code == 200:
+                    # 获取出口IP和地理位置信息（出口IP经代理获取, 地理位置本机查询ipapi.co并缓存）
+                    if site['key'] == 'ip_check' and status == 200:
                         try:
-                            geo_data = response.json()
-                            proxy_info['exit_ip'] = geo_data.get('ip')
-                            proxy_info['exit_country'] = geo_data.get('country_name')
-                            proxy_info['exit_country_code'] = geo_data.get('country_code')
-                            proxy_info['exit_city'] = geo_data.get('city')
-                            proxy_info['exit_region'] = geo_data.get('region')
-                            print(
-                                f"  -> 出口IP: {proxy_info['exit_ip']}, 位置: {proxy_info['exit_city']}, {proxy_info['exit_country']}")
+                            proxy_info.exit_ip = orjson.loads(body).get('ip')
+                            geo_data = _geo_for_ip(proxy_info.exit_ip)
+                            proxy_info.exit_country = geo_data.get('country_name')
+                            proxy_info.exit_country_code = geo_data.get('country_code')
+                            proxy_info.exit_city = geo_data.get('city')
+                            proxy_info.exit_region = geo_data.get('region')
+                            logger.info("  -> 出口IP: %s, 位置: %s, %s",
+                                        proxy_info.exit_ip, proxy_info.exit_city, proxy_info.exit_country)
                         except Exception as e:
-                            print(f"  -> 解析地理位置失败: {e}")
+                            logger.info("  -> 解析地理位置失败: %s", e)
 
                     # 记录可访问的站点
-                    if site['name'] not in proxy_info['accessible_sites'] and site['name'] != 'IP Check':
-                        proxy_info['accessible_sites'].append(site['name'])
+                    if site['name'] not in proxy_info.accessible_sites and site['name'] != 'IP Check':
+                        proxy_info.accessible_sites.append(site['name'])
 
                     # 标记特定站点可访问
-                    if site['key'] in proxy_info:
-                        proxy_info[site['key']] = True
+                    if hasattr(proxy_info, site['key']):
+                        setattr(proxy_info, site['key'], True)
 
                     # 记录最快的响应时间
                     if best_time is None or elapsed < best_time:
                         best_time = elapsed
-                        proxy_info['response_time'] = round(elapsed * 1000, 2)
-
-            except requests.exceptions.ProxyError:
-                proxy_info['error'] = 'Proxy connection failed'
-            except requests.exceptions.Timeout:
-                proxy_info['error'] = 'Request timeout'
-            except requests.exceptions.SSLError:
-                proxy_info['error'] = 'SSL error'
-            except requests.exceptions.ConnectionError:
-                proxy_info['error'] = 'Connection error'
+                        proxy_info.response_time = round(elapsed * 1000, 2)
+
+            except ProxyError:
+                proxy_info.error = 'Proxy connection failed'
+            except NewConnectionError:
+                proxy_info.error = 'Connection error'
+            except HTTPTimeoutError:
+                proxy_info.error = 'Request timeout'
+            except SSLError:
+                proxy_info.error = 'SSL error'
+            except ProtocolError:
+                proxy_info.error = 'Connection error'
             except Exception as e:
-                proxy_info['error'] = str(e)
+                proxy_info.error = str(e)
 
         # 如果找到可用的配置就停止
-        if proxy_info['is_working']:
+        if proxy_info.is_working:
             break
 
     # 如果代理可用且需要检测AI模型，则进行检测
-    if proxy_info['is_working'] and check_ai_models and working_proxies:
-        print(f"  -> 检测AI模型可用性...")
-        proxy_info['ai_models'] = test_ai_model_availability(working_proxies, timeout)
+    if proxy_info.is_working and check_ai_models and working_proxy_url:
+        logger.info("  -> 检测AI模型可用性...")
+        proxy_info.ai_models = test_ai_model_availability(working_proxy_url, timeout)
 
         # 统计可用的AI模型数量
-        available_models = [name for name, info in proxy_info['ai_models'].items() if info['available']]
+        available_models = [name for name, info in proxy_info.ai_models.items() if info['available']]
         if available_models:
-            print(f"  -> 可用AI模型: {', '.join(available_models)}")
+            logger.info("  -> 可用AI模型: %s", ', '.join(available_models))
 
     # 计算质量分数 (0-100)
-    if proxy_info['is_working']:
+    if proxy_info.is_working:
         score = 30  # 基础分 - 能工作
 
         # 可访问的外网站点数量 (0-30分)
-        accessible_count = len(proxy_info['accessible_sites'])
+        accessible_count = len(proxy_info.accessible_sites)
         if accessible_count >= 3:
             score += 30
         elif accessible_count >= 2:
@@ -312,23 +522,23 @@ def test_proxy_quality(ip, port, timeout=8, check_ai_models=True):
             score += 20
 
         # 响应时间评分 (0-30分)
-        if proxy_info['response_time'] is not None:
-            if proxy_info['response_time'] < 300:
+        if proxy_info.response_time is not None:
+            if proxy_info.response_time < 300:
                 score += 30  # 超快
-            elif proxy_info['response_time'] < 600:
+            elif proxy_info.response_time < 600:
                 score += 25  # 很快
-            elif proxy_info['response_time'] < 1000:
+            elif proxy_info.response_time < 1000:
                 score += 20  # 快
-            elif proxy_info['response_time'] < 2000:
+            elif proxy_info.response_time < 2000:
                 score += 15  # 中等
-            elif proxy_info['response_time'] < 3000:
+            elif proxy_info.response_time < 3000:
                 score += 10  # 较慢
-            elif proxy_info['response_time'] < 5000:
+            elif proxy_info.response_time < 5000:
                 score += 5  # 很慢
 
         # AI模型可用性加分 (0-10分)
-        if proxy_info['ai_models']:
-            available_models_count = sum(1 for info in proxy_info['ai_models'].values() if info['available'])
+        if proxy_info.ai_models:
+            available_models_count = sum(1 for info in proxy_info.ai_models.values() if info['available'])
             if available_models_count >= 4:
                 score += 10
             elif available_models_count >= 3:
@@ -338,62 +548,218 @@ def test_proxy_quality(ip, port, timeout=8, check_ai_models=True):
             elif available_models_count >= 1:
                 score += 4
 
-        proxy_info['quality_score'] = score
+        proxy_info.quality_score = score
 
         # 质量等级 - 针对翻墙代理
         if score >= 85:
-            proxy_info['quality_level'] = 'excellent'  # 优秀
+            proxy_info.quality_level = 'excellent'  # 优秀
         elif score >= 70:
-            proxy_info['quality_level'] = 'good'  # 良好
+            proxy_info.quality_level = 'good'  # 良好
         elif score >= 55:
-            proxy_info['quality_level'] = 'fair'  # 一般
+            proxy_info.quality_level = 'fair'  # 一般
         elif score >= 40:
-            proxy_info['quality_level'] = 'poor'  # 较差
+            proxy_info.quality_level = 'poor'  # 较差
         else:
-            proxy_info['quality_level'] = 'bad'  # 很差
+            proxy_info.quality_level = 'bad'  # 很差
     else:
-        proxy_info['quality_level'] = 'unavailable'  # 不可用
+        proxy_info.quality_level = 'unavailable'  # 不可用
 
     return proxy_info
 
 
-def scan_port(ip, port, check_quality=False, timeout=1):
-    """扫描单个IP的指定端口"""
+def _max_inflight_sockets():
+    """根据进程文件描述符上限计算可同时发起的连接数"""
     try:
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        sock.settimeout(timeout)
-        result = sock.connect_ex((str(ip), port))
-        sock.close()
-
-        if result == 0:
-            base_result = {
-                'ip': str(ip),
-                'port': port,
-                'status': 'open',
-                'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            }
-
-            # 如果需要检测代理质量
-            if check_quality:
-                print(f"正在检测代理质量: {ip}:{port} (测试外网访问+地理位置)")
-                proxy_quality = test_proxy_quality(str(ip), port)
-                base_result.update({
-                    'proxy_quality': proxy_quality,
-                    'is_proxy_working': proxy_quality['is_working'],
-                    'response_time': proxy_quality['response_time'],
-                    'quality_score': proxy_quality['quality_score'],
-                    'quality_level': proxy_quality['quality_level'],
-                    'accessible_sites': proxy_quality['accessible_sites'],
-                    'can_access_google': proxy_quality['can_access_google'],
-                    'proxy_type': proxy_quality['proxy_type'],
-                    'exit_ip': proxy_quality['exit_ip'],
-                    'exit_country': proxy_quality['exit_country'],
-                    'exit_country_code': proxy_quality['exit_country_code'],
-                    'exit_city': proxy_quality['exit_city'],
-                    'ai_models': proxy_quality['ai_models']
-                })
-
-            return base_result
+        import resource
+    except ImportError:  # Windows 无 resource 模块
+        return 512
+    soft_limit, _ = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft_limit == resource.RLIM_INFINITY:
+        return 4096
+    # 预留文件描述符给 Flask 和代理检测的HTTP连接
+    return max(64, min(4096, soft_limit - 256))
+
+
+# Linux 下创建socket时直接指定非阻塞, 省去每个连接一次 fcntl 系统调用
+_SOCK_NONBLOCK = getattr(socket, 'SOCK_NONBLOCK', 0)
+_NONBLOCKING_STREAM = socket.SOCK_STREAM | _SOCK_NONBLOCK
+
+
+# SO_LINGER {onoff=1, linger=0}: close() 直接发送RST, 不进入 TIME_WAIT
+_LINGER_RESET = struct.pack('ii', 1, 0)
+_TCP_QUICKACK = getattr(socket, 'TCP_QUICKACK', None)
+
+
+def _reset_on_close(sock):
+    """已连接的探测socket改为RST关闭, 省去FIN挥手并立即释放本地端口"""
+    try:
+        if _TCP_QUICKACK is not None:
+            sock.setsockopt(socket.IPPROTO_TCP, _TCP_QUICKACK, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, _LINGER_RESET)
+    except OSError:
+        pass
+
+
+def fast_tcp_scan(hosts, port, timeout=1, max_inflight=None, family=socket.AF_INET):
+    """
+    非阻塞批量TCP连接扫描
+    单线程发起大量非阻塞 connect, 通过 selectors (Linux 下为 epoll) 等待结果
+    逐个产出 (ip, 是否开放), 顺序为完成顺序; family 为 hosts 的地址族 (AF_INET / AF_INET6)
+    """
+    if max_inflight is None:
+        max_inflight = _max_inflight_sockets()
+
+    selector = selectors.DefaultSelector()
+    hosts_iter = iter(hosts)
+    # 所有连接超时时间相同, 按发起顺序排列即按截止时间排列
+    deadlines = deque()
+    inflight = 0
+    pending_ip = None
+
+    try:
+        while True:
+            # 补充新的连接, 保持在途连接数不超过上限
+            while inflight < max_inflight:
+                ip = pending_ip or next(hosts_iter, None)
+                pending_ip = None
+                if ip is None:
+                    break
+
+                # 全局连接配额: 有在途连接时不等待, 先处理已有连接释放配额
+                if not connect_slots.acquire(blocking=not inflight):
+                    pending_ip = ip
+                    break
+
+                # 从这里到连接登记进 selector 之前, 任何异常都要归还配额
+                try:
+                    sock = socket.socket(family, _NONBLOCKING_STREAM)
+                except OSError as e:
+                    connect_slots.release()
+                    if e.errno in (errno.EMFILE, errno.ENFILE) and inflight:
+                        # 文件描述符耗尽, 等已有连接完成后再重试
+                        pending_ip = ip
+                        break
+                    raise
+                except BaseException:
+                    connect_slots.release()
+                    raise
+
+                try:
+                    if not _SOCK_NONBLOCK:
+                        sock.setblocking(False)
+                    err = sock.connect_ex((ip, port))
+                    if err in (errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EALREADY):
+                        selector.register(sock, selectors.EVENT_WRITE, ip)
+                except OSError:
+                    # 地址无法解析/不可用等, 该主机视为未开放
+                    sock.close()
+                    connect_slots.release()
+                    yield ip, False
+                    continue
+                except BaseException:
+                    sock.close()
+                    connect_slots.release()
+                    raise
+
+                if err in (errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EALREADY):
+                    deadlines.append((time.monotonic() + timeout, sock))
+                    inflight += 1
+                else:
+                    # 立即完成 (如本机地址) 或立即失败
+                    if err == 0:
+                        _reset_on_close(sock)
+                    sock.close()
+                    connect_slots.release()
+                    yield ip, err == 0
+
+            if not inflight:
+                break
+
+            wait = max(0.0, deadlines[0][0] - time.monotonic())
+            for key, _ in selector.select(wait):
+                sock = key.fileobj
+                err = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                selector.unregister(sock)
+                if err == 0:
+                    _reset_on_close(sock)
+                sock.close()
+                connect_slots.release()
+                inflight -= 1
+                yield key.data, err == 0
+
+            # 清理已完成或已超时的连接
+            now = time.monotonic()
+            while deadlines and (deadlines[0][1].fileno() == -1 or deadlines[0][0] <= now):
+                _, sock = deadlines.popleft()
+                if sock.fileno() != -1:
+                    ip = selector.get_key(sock).data
+                    selector.unregister(sock)
+                    sock.close()
+                    connect_slots.release()
+                    inflight -= 1
+                    yield ip, False
+    finally:
+        for key in list(selector.get_map().values()):
+            key.fileobj.close()
+            connect_slots.release()
+        selector.close()
+
+
+_pack_ipv4 = struct.Struct('!I').pack
+
+
+def iter_host_addresses(network_obj):
+    """
+    逐个生成网段内可用主机的点分地址 (与 hosts() 相同, 跳过网络地址和广播地址)
+    IPv4 按整数递增直接格式化, 不逐个创建 IPv4Address 对象
+    """
+    if network_obj.version != 4:
+        for ip in network_obj.hosts():
+            yield str(ip)
+        return
+
+    first = int(network_obj.network_address)
+    last = int(network_obj.broadcast_address)
+    if network_obj.num_addresses > 2:
+        first += 1
+        last -= 1
+
+    inet_ntoa = socket.inet_ntoa
+    for ip_int in range(first, last + 1):
+        yield inet_ntoa(_pack_ipv4(ip_int))
+
+
+def build_port_result(ip, port, check_quality=False):
+    """生成开放端口的扫描结果, 按需附带代理质量检测"""
+    try:
+        base_result = {
+            'ip': ip,
+            'port': port,
+            'status': 'open',
+            'timestamp': time.time()
+        }
+
+        # 如果需要检测代理质量
+        if check_quality:
+            logger.info("正在检测代理质量: %s:%s (测试外网访问+地理位置)", ip, port)
+            proxy_quality = test_proxy_quality(ip, port)
+            base_result.update({
+                'proxy_quality': asdict(proxy_quality),
+                'is_proxy_working': proxy_quality.is_working,
+                'response_time': proxy_quality.response_time,
+                'quality_score': proxy_quality.quality_score,
+                'quality_level': proxy_quality.quality_level,
+                'accessible_sites': proxy_quality.accessible_sites,
+                'can_access_google': proxy_quality.can_access_google,
+                'proxy_type': proxy_quality.proxy_type,
+                'exit_ip': proxy_quality.exit_ip,
+                'exit_country': proxy_quality.exit_country,
+                'exit_country_code': proxy_quality.exit_country_code,
+                'exit_city': proxy_quality.exit_city,
+                'ai_models': proxy_quality.ai_models
+            })
+
+        return base_result
     except Exception as e:
         pass
     return None
@@ -401,68 +767,98 @@ def scan_port(ip, port, check_quality=False, timeout=1):
 
 def scan_network_thread(task_id):
     """后台扫描线程"""
-    with tasks_lock:
-        if task_id not in scan_tasks:
-            return
-        task = scan_tasks[task_id]
+    task = scan_tasks.get(task_id)
+    if task is None:
+        return
 
     task.is_scanning = True
-    task.start_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    task.start_time = time.time()
+    task.touch()
 
     try:
-        network_obj = ipaddress.ip_network(task.network, strict=False)
+        network_obj = task.network_obj
         total_hosts = network_obj.num_addresses
         task.total = total_hosts
-
-        with ThreadPoolExecutor(max_workers=task.threads) as executor:
-            futures = [
-                executor.submit(scan_port, ip, task.port, task.check_proxy_quality)
-                for ip in network_obj.hosts()
-            ]
-
-            for future in futures:
-                result = future.result()
-                task.scanned += 1
-                task.progress = int((task.scanned / total_hosts) * 100)
-
-                if result:
-                    task.results.append(result)
+        task.touch()
+
+        # 进度每完成64个主机更新一次, 避免每个主机都做一次除法
+        progress_scale = 100.0 / total_hosts
+
+        futures = []
+
+        # 端口扫描: 关闭的端口直接计入进度, 开放的端口交给线程池生成结果/检测代理质量
+        hosts = iter_host_addresses(network_obj)
+        family = socket.AF_INET if network_obj.version == 4 else socket.AF_INET6
+        # 每个任务同时在途的连接数由 threads 决定, 不超过文件描述符允许的上限
+        max_inflight = min(task.threads, _max_inflight_sockets())
+        for ip, is_open in fast_tcp_scan(hosts, task.port, max_inflight=max_inflight, family=family):
+            if is_open:
+                futures.append(scan_executor.submit(build_port_result, ip, task.port, task.check_proxy_quality))
+                continue
+            task.scanned += 1
+            if task.scanned & 0x3F == 0:
+                task.progress = int(task.scanned * progress_scale)
+                task.touch()
+
+        # 按完成顺序收集结果, 检测慢的代理不会阻塞其他结果
+        for future in as_completed(futures):
+            result = future.result()
+            task.scanned += 1
+            if task.scanned & 0x3F == 0:
+                task.progress = int(task.scanned * progress_scale)
+                task.touch()
+
+            if result:
+                task.results.append(result)
+                task.touch()
+
+        task.progress = int(task.scanned * progress_scale)
 
     except Exception as e:
-        print(f"扫描错误 (Task {task_id}): {e}")
+        logger.error("扫描错误 (Task %s): %s", task_id, e)
         task.error = str(e)
 
     finally:
         task.is_scanning = False
-        task.end_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        task.end_time = time.time()
 
         # 如果启用了代理检测，对结果按质量分数排序
+        # (生成新列表再替换, 原地排序时并发读取会看到空列表)
         if task.check_proxy_quality and task.results:
-            task.results.sort(key=lambda x: x.get('quality_score', 0), reverse=True)
+            task.results = sorted(task.results, key=lambda x: x.get('quality_score', 0), reverse=True)
 
+        task.touch()
 
-def cleanup_old_tasks():
-    """清理超过1小时的旧任务"""
-    while True:
-        time.sleep(300)  # 每5分钟清理一次
-        with tasks_lock:
-            current_time = datetime.now()
-            tasks_to_remove = []
 
-            for task_id, task in scan_tasks.items():
-                if not task.is_scanning:
-                    age = (current_time - task.created_at).total_seconds()
-                    if age > 3600:  # 1小时
-                        tasks_to_remove.append(task_id)
+def evict_expired_tasks():
+    """清理超过1小时的旧任务 (按过期时间堆依次弹出, 只处理已到期的任务)"""
+    now = time.time()
+    # 未到期时不加锁直接返回; 其他线程可能同时在锁内弹出最后一项, 只读取一次堆顶
+    try:
+        head_expiry = task_expiry[0][0]
+    except IndexError:
+        return
+    if head_expiry > now:
+        return
 
-            for task_id in tasks_to_remove:
-                del scan_tasks[task_id]
-                print(f"清理旧任务: {task_id}")
+    with tasks_lock:
+        while task_expiry and task_expiry[0][0] <= now:
+            _, task_id = heapq.heappop(task_expiry)
+            task = scan_tasks.get(task_id)
+            if task is None:  # 已被手动删除
+                continue
+            if task.is_scanning:
+                # 扫描中的任务不清理, 稍后再检查
+                heapq.heappush(task_expiry, (now + TASK_RECHECK_INTERVAL, task_id))
+                continue
+            del scan_tasks[task_id]
+            logger.info("清理旧任务: %s", task_id)
 
 
-# 启动清理线程
-cleanup_thread = threading.Thread(target=cleanup_old_tasks, daemon=True)
-cleanup_thread.start()
+@app.before_request
+def before_request():
+    """每次请求前清理到期任务, 无需后台清理线程"""
+    evict_expired_tasks()
 
 
 @app.route('/api/scan', methods=['POST'])
@@ -484,29 +880,33 @@ def start_scan():
         threads = int(data.get('threads', 50))
         check_proxy_quality = data.get('check_proxy_quality', False)
 
-        # 验证网络地址
-        ipaddress.ip_network(network, strict=False)
-
         # 验证端口范围
         if not (1 <= port <= 65535):
-            return jsonify({
+            return json_response({
                 'status': 'error',
                 'message': '端口号必须在1-65535之间'
             }), 400
 
-        # 创建新任务
+        if threads < 1:
+            return json_response({
+                'status': 'error',
+                'message': '并发线程数必须大于0'
+            }), 400
+
+        # 创建新任务 (同时验证网络地址)
         task_id = str(uuid.uuid4())
         task = ScanTask(task_id, network, port, threads, check_proxy_quality)
 
         with tasks_lock:
             scan_tasks[task_id] = task
+            heapq.heappush(task_expiry, (task.created_at + TASK_TTL, task_id))
 
         # 启动后台扫描线程
         thread = threading.Thread(target=scan_network_thread, args=(task_id,))
         thread.daemon = True
         thread.start()
 
-        return jsonify({
+        return json_response({
             'status': 'success',
             'task_id': task_id,
             'message': '扫描任务已创建' + (' (含代理质量检测)' if check_proxy_quality else ''),
@@ -514,12 +914,12 @@ def start_scan():
         })
 
     except ValueError as e:
-        return jsonify({
+        return json_response({
             'status': 'error',
             'message': f'参数错误: {str(e)}'
         }), 400
     except Exception as e:
-        return jsonify({
+        return json_response({
             'status': 'error',
             'message': f'创建任务失败: {str(e)}'
         }), 500
@@ -528,51 +928,46 @@ def start_scan():
 @app.route('/api/task/<task_id>', methods=['GET'])
 def get_task_status(task_id):
     """获取指定任务的状态"""
-    with tasks_lock:
-        if task_id not in scan_tasks:
-            return jsonify({
-                'status': 'error',
-                'message': '任务不存在或已过期'
-            }), 404
+    task = scan_tasks.get(task_id)
+    if task is None:
+        return json_response({
+            'status': 'error',
+            'message': '任务不存在或已过期'
+        }), 404
 
-        task = scan_tasks[task_id]
-
-    return jsonify({
-        'status': 'success',
-        'data': task.to_dict()
-    })
+    return app.response_class(
+        b'{"status":"success","data":' + task.to_json() + b'}',
+        mimetype='application/json'
+    )
 
 
 @app.route('/api/tasks', methods=['GET'])
 def get_all_tasks():
     """获取所有任务列表"""
-    with tasks_lock:
-        tasks_list = [task.to_dict() for task in scan_tasks.values()]
+    tasks_list = [task.to_json() for task in list(scan_tasks.values())]
 
-    return jsonify({
-        'status': 'success',
-        'total': len(tasks_list),
-        'data': tasks_list
-    })
+    # 直接拼接各任务缓存的JSON, 未变化的任务无需重新序列化
+    return app.response_class(
+        b'{"status":"success","total":%d,"data":[' % len(tasks_list) + b','.join(tasks_list) + b']}',
+        mimetype='application/json'
+    )
 
 
 @app.route('/api/task/<task_id>/results', methods=['GET'])
 def get_task_results(task_id):
     """获取指定任务的扫描结果"""
-    with tasks_lock:
-        if task_id not in scan_tasks:
-            return jsonify({
-                'status': 'error',
-                'message': '任务不存在'
-            }), 404
-
-        task = scan_tasks[task_id]
+    task = scan_tasks.get(task_id)
+    if task is None:
+        return json_response({
+            'status': 'error',
+            'message': '任务不存在'
+        }), 404
 
-    return jsonify({
+    return json_response({
         'status': 'success',
         'data': {
             'task_id': task_id,
-            'results': task.results,
+            'results': task.formatted_results(),
             'total': len(task.results),
             'is_scanning': task.is_scanning,
             'check_proxy_quality': task.check_proxy_quality
@@ -585,7 +980,7 @@ def delete_task(task_id):
     """删除指定任务"""
     with tasks_lock:
         if task_id not in scan_tasks:
-            return jsonify({
+            return json_response({
                 'status': 'error',
                 'message': '任务不存在'
             }), 404
@@ -593,14 +988,14 @@ def delete_task(task_id):
         task = scan_tasks[task_id]
 
         if task.is_scanning:
-            return jsonify({
+            return json_response({
                 'status': 'error',
                 'message': '任务正在扫描中，无法删除'
             }), 400
 
         del scan_tasks[task_id]
 
-    return jsonify({
+    return json_response({
         'status': 'success',
         'message': '任务已删除'
     })
@@ -609,12 +1004,12 @@ def delete_task(task_id):
 @app.route('/api/stats', methods=['GET'])
 def get_stats():
     """获取系统统计信息"""
-    with tasks_lock:
-        total_tasks = len(scan_tasks)
-        active_tasks = sum(1 for task in scan_tasks.values() if task.is_scanning)
-        completed_tasks = sum(1 for task in scan_tasks.values() if not task.is_scanning and task.end_time)
+    tasks_list = list(scan_tasks.values())
+    total_tasks = len(tasks_list)
+    active_tasks = sum(1 for task in tasks_list if task.is_scanning)
+    completed_tasks = sum(1 for task in tasks_list if not task.is_scanning and task.end_time)
 
-    return jsonify({
+    return json_response({
         'status': 'success',
         'data': {
             'total_tasks': total_tasks,
@@ -628,7 +1023,7 @@ def get_stats():
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """健康检查"""
-    return jsonify({
+    return json_response({
         'status': 'success',
         'message': '服务运行正常',
         'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
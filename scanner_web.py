@@ -5,85 +5,529 @@
 提供实时扫描和结果展示的Web界面
 """
 
-from flask import Flask, render_template_string, jsonify, request
+from flask import Flask, Response, jsonify, request
+from flask.json.provider import JSONProvider
 from flask_cors import CORS
+import orjson
 import socket
+import struct
+import select
+import selectors
+import random
+import errno
+import sys
 import ipaddress
-from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import atexit
+import queue
+import multiprocessing as mp
+from multiprocessing import shared_memory
+from array import array
+from itertools import islice
+from collections import deque
 from datetime import datetime
 import threading
 import time
 
+
+class OrjsonProvider(JSONProvider):
+    """使用 orjson 序列化的 JSON provider, jsonify 无需改动"""
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        # 直接返回 orjson 生成的 bytes, 省去一次解码
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(orjson.dumps(obj), mimetype='application/json')
+
+
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 CORS(app)
 
 # 全局变量存储扫描状态
 scan_status = {
     'is_scanning': False,
-    'progress': 0,
-    'total': 0,
-    'scanned': 0,
-    'results': [],
+    'cancelled': False,
+    'port': None,
     'start_time': None,
+    'start_ms': 0,
     'end_time': None
 }
 
+# 扫描开始时的单调时钟, 结果只记录相对它的秒数, 由前端换算成时间
+scan_t0 = 0.0
+
+# 扫描计数 (已扫描, 总数, 开放数). 扫描在子进程中进行, 首次扫描时改为共享内存,
+# 子进程写, Web进程直接读
+SCANNED, TOTAL, OPEN = 0, 1, 2
+# 计数为64位无符号整数, 更大的网段 (如 IPv6 /64) 无法计数
+MAX_SCAN_ADDRESSES = 2 ** 64 - 1
+scan_counters = array('Q', [0, 0, 0])
+counters_shm = None
+
+# 开放结果按列存储: IP (IPv4为整数, IPv6为字符串) 和发现时间 (相对 scan_t0 的秒数)
+# 端口对整次扫描相同, 记录在 scan_status['port']. 两列只追加, 前端按下标增量获取
+result_ips = array('I')
+result_times = array('f')
+
+# 扫描有进展时通知等待中的状态请求 (长轮询)
+scan_progress = threading.Condition()
+
+# 子进程 -> Web进程的事件队列: (ip, 时间) 为开放结果, SCAN_PROGRESS 为进度变化, SCAN_DONE 为扫描结束
+SCAN_PROGRESS, SCAN_DONE = 'progress', 'done'
+scan_events = None
+
+# 停止扫描的标志 (multiprocessing.Event), 扫描循环在每批/每轮之间检查
+cancel_event = None
+
+
+def notify_progress():
+    """唤醒等待扫描进展的状态请求"""
+    with scan_progress:
+        scan_progress.notify_all()
+
+
+def report_progress():
+    """(扫描进程) 通知Web进程计数有变化"""
+    scan_events.put(SCAN_PROGRESS)
+
+
+def record_open(ip):
+    """(扫描进程) 记录一个开放的主机"""
+    scan_events.put((ip, time.monotonic() - scan_t0))
+    scan_counters[OPEN] += 1
+
+
+# TCP 标志位
+TCP_SYN = 0x02
+TCP_ACK = 0x10
+
+
+# 关闭时直接发送RST, 不进入 TIME_WAIT 占用本地端口
+LINGER_RESET = struct.pack('ii', 1, 0)
 
-def scan_port(ip, port, timeout=1):
-    """扫描单个IP的指定端口"""
+# 探测循环中每个主机都要用到, 提前绑定省去模块属性查找
+_new_socket = socket.socket
+_AF_INET = socket.AF_INET
+_SOCK_STREAM = socket.SOCK_STREAM
+_HAS_SOCK_NONBLOCK = hasattr(socket, 'SOCK_NONBLOCK')
+_NONBLOCKING_STREAM = socket.SOCK_STREAM | getattr(socket, 'SOCK_NONBLOCK', 0)
+# 非阻塞 connect_ex 的"连接进行中"返回值 (Windows 上为 WSAEWOULDBLOCK)
+_CONNECT_PENDING = (0, errno.EINPROGRESS, errno.EWOULDBLOCK)
+_SOCKOPT_NODELAY = (socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+_SOCKOPT_LINGER = (socket.SOL_SOCKET, socket.SO_LINGER, LINGER_RESET)
+_inet_ntoa = socket.inet_ntoa
+
+
+def _checksum(data):
+    """IP/TCP 校验和 (16位反码和)"""
+    if len(data) % 2:
+        data += b'\0'
+    total = sum(struct.unpack('!%dH' % (len(data) // 2), data))
+    while total >> 16:
+        total = (total & 0xffff) + (total >> 16)
+    return ~total & 0xffff
+
+
+def _build_syn_packet(src_ip, dst_ip, src_port, dst_port, seq):
+    """构造 IP + TCP SYN 包 (src_ip/dst_ip 为4字节地址)"""
+    tcp_header = struct.pack('!HHIIBBHHH', src_port, dst_port, seq, 0, 5 << 4, TCP_SYN, 65535, 0, 0)
+    pseudo_header = src_ip + dst_ip + struct.pack('!BBH', 0, socket.IPPROTO_TCP, len(tcp_header))
+    tcp_header = tcp_header[:16] + struct.pack('!H', _checksum(pseudo_header + tcp_header)) + tcp_header[18:]
+
+    # IHL=5, 总长度和IP校验和由内核填写
+    ip_header = struct.pack('!BBHHHBBH4s4s', 0x45, 0, 0, 0, 0, 64, socket.IPPROTO_TCP, 0, src_ip, dst_ip)
+    return ip_header + tcp_header
+
+
+def ipv4_host_range(network_obj):
+    """IPv4 网段的主机地址整数范围, 与 hosts() 相同: /31、/32 包含全部地址, 其余去掉网络和广播地址"""
+    first = int(network_obj.network_address)
+    last = int(network_obj.broadcast_address)
+    if network_obj.prefixlen >= 31:
+        return range(first, last + 1)
+    return range(first + 1, last)
+
+
+def can_syn_scan():
+    """是否可以使用原始套接字进行SYN扫描 (Linux + root/CAP_NET_RAW)"""
+    if not sys.platform.startswith('linux'):
+        return False
     try:
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        sock.settimeout(timeout)
-        result = sock.connect_ex((str(ip), port))
-        sock.close()
+        socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_TCP).close()
+    except OSError:
+        return False
+    return True
+
+
+# 每个"线程"对应的SYN发送速率 (包/秒), 默认 50 线程即每秒 5000 个SYN
+SYN_RATE_PER_THREAD = 100
+# 每个主机最多发送的SYN次数, 没有回应的主机在下一轮重发
+SYN_ATTEMPTS = 2
+# 接收原始套接字的缓冲区大小, 默认约 208KB, 突发的 SYN-ACK 会被内核丢弃
+SYN_RCVBUF = 8 * 1024 * 1024
+
+
+def syn_scan(network_obj, port, threads, timeout=1):
+    """
+    SYN扫描: 一个线程按 threads * SYN_RATE_PER_THREAD 包/秒 的速率发送SYN包, 当前线程接收并匹配 SYN-ACK
+    不建立完整连接, 也没有逐个主机的超时等待, 没有回应的主机重发一次, 整体只在发送完成后等待 timeout 秒
+    收到 SYN-ACK 后内核发现没有对应的连接会自动回复RST, 不会留下半开连接
+    """
+    hosts = ipv4_host_range(network_obj)
+    if not hosts:
+        return
+
+    # 通过UDP connect 获取发往目标网段时使用的本机地址
+    probe = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        probe.connect((socket.inet_ntoa(hosts[0].to_bytes(4, 'big')), port))
+        src_ip = socket.inet_aton(probe.getsockname()[0])
+    finally:
+        probe.close()
 
-        if result == 0:
-            return {
-                'ip': str(ip),
-                'port': port,
-                'status': 'open',
-                'timestamp': datetime.now().strftime('%H:%M:%S')
-            }
-    except:
-        pass
-    return None
+    src_port = random.randint(40000, 60000)
+    # 初始序列号由目标IP计算, 回包的确认号即可验证来源
+    secret = random.getrandbits(32)
 
+    def isn(ip_bytes):
+        return (int.from_bytes(ip_bytes, 'big') * 2654435761 ^ secret) & 0xffffffff
 
-def scan_network_thread(network, port, threads):
-    """后台扫描线程"""
-    global scan_status
+    send_sock = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_TCP)
+    send_sock.setsockopt(socket.IPPROTO_IP, socket.IP_HDRINCL, 1)
+    recv_sock = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_TCP)
+    try:
+        # root 可以用 SO_RCVBUFFORCE 突破 net.core.rmem_max
+        recv_sock.setsockopt(socket.SOL_SOCKET, getattr(socket, 'SO_RCVBUFFORCE', socket.SO_RCVBUF), SYN_RCVBUF)
+    except OSError:
+        recv_sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SYN_RCVBUF)
+    recv_sock.setblocking(False)
+    send_done = threading.Event()
+    seen = set()  # 已回应 SYN-ACK 的4字节地址
+    interval = 1 / (max(threads, 1) * SYN_RATE_PER_THREAD)
+
+    def sender():
+        next_send = time.monotonic()
+        try:
+            for attempt in range(SYN_ATTEMPTS):
+                for ip_int in hosts:
+                    if cancel_event.is_set():
+                        return
+                    dst_ip = ip_int.to_bytes(4, 'big')
+                    if attempt and dst_ip in seen:
+                        continue
+                    packet = _build_syn_packet(src_ip, dst_ip, src_port, port, isn(dst_ip))
+                    address = (_inet_ntoa(dst_ip), 0)
+                    while True:
+                        try:
+                            send_sock.sendto(packet, address)
+                            break
+                        except OSError as e:
+                            if e.errno != errno.ENOBUFS:
+                                break  # 该地址无法发送 (如广播地址返回 EACCES), 视为关闭
+                            time.sleep(0.001)  # 发送缓冲区满, 稍后重试
+
+                    # 限速: 累计超前超过1毫秒再休眠, 避免逐包 sleep
+                    next_send += interval
+                    delay = next_send - time.monotonic()
+                    if delay > 0.001:
+                        time.sleep(delay)
+
+                    if not attempt:
+                        scan_counters[SCANNED] += 1
+                        if scan_counters[SCANNED] % 256 == 0:
+                            report_progress()
+        finally:
+            send_done.set()
+            report_progress()
+
+    sender_thread = threading.Thread(target=sender, daemon=True)
+    sender_thread.start()
+    try:
+        deadline = None
+        while True:
+            if deadline is None and send_done.is_set():
+                deadline = time.time() + timeout
+            if deadline is not None and time.time() >= deadline:
+                break
+
+            readable, _, _ = select.select([recv_sock], [], [], 0.1)
+            if not readable:
+                continue
+
+            # 一次唤醒读空接收缓冲区
+            found = False
+            while True:
+                try:
+                    packet = recv_sock.recv(65535)
+                except BlockingIOError:
+                    break
+                ihl = (packet[0] & 0x0f) * 4
+                if len(packet) < ihl + 14:
+                    continue
+                sport, dport, _, ack, _, flags = struct.unpack('!HHIIBB', packet[ihl:ihl + 14])
+                if sport != port or dport != src_port:
+                    continue
+
+                remote_ip = packet[12:16]
+                if flags & (TCP_SYN | TCP_ACK) == (TCP_SYN | TCP_ACK) and ack == (isn(remote_ip) + 1) & 0xffffffff:
+                    if remote_ip in seen:
+                        continue
+                    seen.add(remote_ip)
+                    record_open(int.from_bytes(remote_ip, 'big'))
+                    found = True
+            if found:
+                report_progress()
+    finally:
+        sender_thread.join()
+        send_sock.close()
+        recv_sock.close()
+
+
+async def scan_port(ip, address, family, semaphore, timeout=1):
+    """扫描单个地址 (ip字符串, 端口), 开放时返回 ip, semaphore 限制同时进行的连接数"""
+    async with semaphore:
+        sock = _new_socket(family, _SOCK_STREAM)
+        try:
+            sock.setblocking(False)
+            sock.setsockopt(*_SOCKOPT_NODELAY)
+            sock.setsockopt(*_SOCKOPT_LINGER)
+            await asyncio.wait_for(asyncio.get_running_loop().sock_connect(sock, address), timeout)
+        except (OSError, asyncio.TimeoutError):
+            return None
+        finally:
+            sock.close()
+        return ip
+
+
+async def scan_hosts(network_obj, port, concurrency):
+    """
+    在同一个事件循环中并发扫描网段内所有主机, 按完成顺序更新进度
+    主机分批创建任务, 同时存在的任务不超过 concurrency*4 个, 大网段也不会一次性创建全部任务
+    """
+    concurrency = max(1, min(concurrency, max_inflight_sockets()))
+    semaphore = asyncio.Semaphore(concurrency)
+    window = concurrency * 4
+    is_ipv4 = network_obj.version == 4
+    family = socket.AF_INET if is_ipv4 else socket.AF_INET6
+
+    def target(ip):
+        # 每个主机只转换一次字符串; 结果列中IPv4记录整数, IPv6记录同一个字符串
+        ip_str = str(ip)
+        return int(ip) if is_ipv4 else ip_str, (ip_str, port)
+
+    targets = (target(ip) for ip in network_obj.hosts())
+    pending = {asyncio.ensure_future(scan_port(*t, family, semaphore)) for t in islice(targets, window)}
+
+    while pending:
+        if cancel_event.is_set():
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            break
+
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        finished = len(done)
+        # 逐个取出已完成的任务, 等待下一批时不再持有它们
+        while done:
+            ip = done.pop().result()
+            scan_counters[SCANNED] += 1
+            if ip is not None:
+                record_open(ip)
+        report_progress()
+
+        pending.update(
+            asyncio.ensure_future(scan_port(*t, family, semaphore)) for t in islice(targets, finished)
+        )
+
+
+def max_inflight_sockets():
+    """根据进程文件描述符上限计算可同时发起的连接数"""
+    try:
+        import resource
+    except ImportError:  # Windows 无 resource 模块
+        return 512
+    soft_limit, _ = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft_limit == resource.RLIM_INFINITY:
+        return 4096
+    # 预留文件描述符给队列、共享内存等
+    return max(16, min(4096, soft_limit - 64))
+
+
+def batch_connect_scan(network_obj, port, concurrency, timeout=1):
+    """
+    批量连接扫描 (IPv4): 保持最多 concurrency 个非阻塞连接在途 (不超过文件描述符上限),
+    每个连接完成或超时后立即补充新的连接. 通过 selectors (Linux 上为 epoll, macOS 上为 kqueue) 等待可写,
+    再用 SO_ERROR 判断是否连接成功
+    """
+    window = max(1, min(concurrency, max_inflight_sockets()))
+    hosts = iter(ipv4_host_range(network_obj))
+    selector = selectors.DefaultSelector()
+    inflight = {}  # 套接字 -> ip整数
+    deadlines = deque()  # (截止时间, 套接字), 超时相同, 按发起顺序即按截止时间排列
+    retry_ip = None
+
+    def finish(sock, is_open, ip_int):
+        del inflight[sock]
+        selector.unregister(sock)
+        if is_open:
+            record_open(ip_int)
+        sock.close()
+        scan_counters[SCANNED] += 1
 
-    scan_status['is_scanning'] = True
-    scan_status['progress'] = 0
-    scan_status['scanned'] = 0
-    scan_status['results'] = []
+    try:
+        while not cancel_event.is_set():
+            # 补满在途窗口
+            while len(inflight) < window:
+                ip_int = retry_ip if retry_ip is not None else next(hosts, None)
+                retry_ip = None
+                if ip_int is None:
+                    break
+                try:
+                    sock = _new_socket(_AF_INET, _NONBLOCKING_STREAM)
+                except OSError as e:
+                    if e.errno in (errno.EMFILE, errno.ENFILE) and inflight:
+                        # 文件描述符耗尽, 等在途连接完成后再重试这个主机
+                        retry_ip = ip_int
+                        break
+                    scan_counters[SCANNED] += 1  # 无法创建套接字, 视为关闭
+                    continue
+
+                try:
+                    if not _HAS_SOCK_NONBLOCK:
+                        sock.setblocking(False)
+                    sock.setsockopt(*_SOCKOPT_NODELAY)
+                    sock.setsockopt(*_SOCKOPT_LINGER)
+                    err = sock.connect_ex((_inet_ntoa(ip_int.to_bytes(4, 'big')), port))
+                except OSError:
+                    err = -1
+                if err not in _CONNECT_PENDING:
+                    sock.close()
+                    scan_counters[SCANNED] += 1
+                    continue
+
+                inflight[sock] = ip_int
+                selector.register(sock, selectors.EVENT_WRITE)
+                deadlines.append((time.monotonic() + timeout, sock))
+
+            if not inflight:
+                break
+
+            # 已完成的连接已关闭 (fileno 为 -1), 跳过它们找到最早的截止时间
+            while deadlines[0][1].fileno() == -1:
+                deadlines.popleft()
+            wait = max(0.0, deadlines[0][0] - time.monotonic())
+
+            for key, _ in selector.select(wait):
+                sock = key.fileobj
+                finish(sock, sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR) == 0, inflight[sock])
+
+            # 超时未完成的视为关闭
+            now = time.monotonic()
+            while deadlines and (deadlines[0][1].fileno() == -1 or deadlines[0][0] <= now):
+                _, sock = deadlines.popleft()
+                if sock.fileno() != -1:
+                    finish(sock, False, None)
+
+            report_progress()
+    finally:
+        for sock in inflight:
+            sock.close()
+            scan_counters[SCANNED] += 1
+        selector.close()
+        report_progress()
+
+
+def release_counters():
+    """退出时释放计数共享内存"""
+    scan_counters.release()
+    counters_shm.close()
+    counters_shm.unlink()
+
+
+def reset_scan_state(network_obj, port):
+    """开始新的扫描: 清空计数和结果, 记录端口和开始时间"""
+    global scan_t0, scan_counters, counters_shm, result_ips, result_times
+
+    if counters_shm is None:
+        counters_shm = shared_memory.SharedMemory(create=True, size=scan_counters.itemsize * len(scan_counters))
+        scan_counters = counters_shm.buf.cast('Q')
+        atexit.register(release_counters)
+
+    scan_counters[SCANNED] = scan_counters[OPEN] = 0
+    scan_counters[TOTAL] = network_obj.num_addresses
+    # IPv6 地址放不进 32 位数组
+    result_ips = array('I') if network_obj.version == 4 else []
+    result_times = array('f')
+    scan_t0 = time.monotonic()
+    scan_status['port'] = port
+    scan_status['start_ms'] = int(time.time() * 1000)
     scan_status['start_time'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    scan_status['cancelled'] = False
+    # 最后置位, 前面任何一步失败都不会留下"扫描中"状态
+    scan_status['is_scanning'] = True
 
-    try:
-        network_obj = ipaddress.ip_network(network, strict=False)
-        total_hosts = network_obj.num_addresses
-        scan_status['total'] = total_hosts
 
-        with ThreadPoolExecutor(max_workers=threads) as executor:
-            futures = [
-                executor.submit(scan_port, ip, port)
-                for ip in network_obj.hosts()
-            ]
+def scan_process_main(network_obj, port, threads, counters_name, events, cancel, t0):
+    """
+    扫描进程入口 (multiprocessing.Process), 在独立进程中扫描, 不与Web进程争用GIL
+    计数写入名为 counters_name 的共享内存, 开放结果和进度通过 events 队列发回, cancel 被设置时提前结束
+    """
+    global scan_counters, scan_events, cancel_event, scan_t0
 
-            for future in futures:
-                result = future.result()
-                scan_status['scanned'] += 1
-                scan_status['progress'] = int((scan_status['scanned'] / total_hosts) * 100)
+    shm = shared_memory.SharedMemory(name=counters_name)
+    scan_counters = shm.buf.cast('Q')
+    scan_events = events
+    cancel_event = cancel
+    scan_t0 = t0
 
-                if result:
-                    scan_status['results'].append(result)
+    try:
+        # 有原始套接字权限时使用SYN扫描, 否则批量发起非阻塞连接; IPv6 使用 asyncio
+        if network_obj.version == 4 and can_syn_scan():
+            syn_scan(network_obj, port, threads)
+        elif network_obj.version == 4:
+            batch_connect_scan(network_obj, port, threads)
+        else:
+            asyncio.run(scan_hosts(network_obj, port, threads))
 
     except Exception as e:
         print(f"扫描错误: {e}")
 
     finally:
-        scan_status['is_scanning'] = False
-        scan_status['end_time'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        events.put(SCAN_DONE)
+        scan_counters.release()
+        shm.close()
+
+
+def relay_scan_events(process, events):
+    """(Web进程) 把扫描进程发回的结果追加到结果列, 并唤醒长轮询, 扫描结束后更新状态"""
+    while True:
+        try:
+            event = events.get(timeout=1)
+        except queue.Empty:
+            if process.is_alive():
+                continue
+            break  # 扫描进程异常退出
+
+        if event == SCAN_DONE:
+            break
+        if event != SCAN_PROGRESS:
+            ip, t = event
+            # 先写IP列再写时间列, 读取方以时间列长度为准
+            result_ips.append(ip)
+            result_times.append(t)
+        notify_progress()
+
+    process.join()
+    scan_status['cancelled'] = cancel_event.is_set()
+    scan_status['is_scanning'] = False
+    scan_status['end_time'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    notify_progress()
 
 
 HTML_TEMPLATE = """
@@ -193,6 +637,17 @@ HTML_TEMPLATE = """
             transform: none;
         }
 
+        .btn-danger {
+            background: #dc3545;
+            color: white;
+            margin-left: 10px;
+        }
+
+        .btn-danger:disabled {
+            background: #ccc;
+            cursor: not-allowed;
+        }
+
         .progress-section {
             padding: 30px;
             display: none;
@@ -359,6 +814,7 @@ HTML_TEMPLATE = """
                 </div>
             </div>
             <button class="btn btn-primary" id="startBtn" onclick="startScan()">开始扫描</button>
+            <button class="btn btn-danger" id="stopBtn" onclick="stopScan()" disabled>停止扫描</button>
         </div>
 
         <div class="progress-section" id="progressSection">
@@ -400,7 +856,9 @@ HTML_TEMPLATE = """
     </div>
 
     <script>
-        let updateInterval;
+        let lastSeen = 0;
+        let lastScanned = -1;
+        const emptyState = document.getElementById('resultsContainer').innerHTML;
 
         function startScan() {
             const network = document.getElementById('network').value;
@@ -413,6 +871,9 @@ HTML_TEMPLATE = """
             document.getElementById('progressSection').classList.add('active');
             document.getElementById('scanStatus').textContent = '扫描中...';
             document.getElementById('scanStatus').classList.add('pulse');
+            document.getElementById('resultsContainer').innerHTML = emptyState;
+            lastSeen = 0;
+            lastScanned = -1;
 
             fetch('/api/scan', {
                 method: 'POST',
@@ -422,13 +883,35 @@ HTML_TEMPLATE = """
             .then(response => response.json())
             .then(data => {
                 if (data.status === 'started') {
-                    updateInterval = setInterval(updateStatus, 500);
+                    document.getElementById('stopBtn').disabled = false;
+                    updateStatus();
+                } else {
+                    startFailed(data.message);
                 }
-            });
+            })
+            .catch(error => startFailed(`启动失败: ${error}`));
+        }
+
+        // 扫描没有启动 (网络地址无效、扫描正在进行中等): 恢复按钮并显示原因
+        function startFailed(message) {
+            const startBtn = document.getElementById('startBtn');
+            const scanStatus = document.getElementById('scanStatus');
+            startBtn.disabled = false;
+            startBtn.textContent = '开始扫描';
+            scanStatus.textContent = message;
+            scanStatus.classList.remove('pulse');
+        }
+
+        function stopScan() {
+            const stopBtn = document.getElementById('stopBtn');
+            stopBtn.disabled = true;
+            document.getElementById('scanStatus').textContent = '正在停止...';
+            fetch('/api/cancel', {method: 'POST'});
         }
 
+        // 长轮询: 服务端在扫描有进展时才返回, 收到响应后立即发起下一次请求
         function updateStatus() {
-            fetch('/api/status')
+            fetch(`/api/status?since=${lastSeen}&last_scanned=${lastScanned}`)
             .then(response => response.json())
             .then(data => {
                 const progressBar = document.getElementById('progressBar');
@@ -441,77 +924,94 @@ HTML_TEMPLATE = """
                 progressBar.style.width = data.progress + '%';
                 progressBar.textContent = data.progress + '%';
                 scannedCount.textContent = `${data.scanned} / ${data.total}`;
-                openCount.textContent = data.results.length;
-                resultCount.textContent = `${data.results.length} 个结果`;
+                openCount.textContent = data.next_since;
+                resultCount.textContent = `${data.next_since} 个结果`;
 
-                updateResultsTable(data.results);
+                appendResults(data);
+                lastSeen = data.next_since;
+                lastScanned = data.scanned;
 
-                if (!data.is_scanning) {
-                    clearInterval(updateInterval);
+                if (data.is_scanning) {
+                    updateStatus();
+                } else {
                     startBtn.disabled = false;
                     startBtn.textContent = '开始扫描';
-                    scanStatus.textContent = '扫描完成';
+                    document.getElementById('stopBtn').disabled = true;
+                    scanStatus.textContent = data.cancelled ? '扫描已停止' : '扫描完成';
                     scanStatus.classList.remove('pulse');
                 }
-            });
+            })
+            .catch(() => setTimeout(updateStatus, 1000));
         }
 
-        function updateResultsTable(results) {
+        // IPv4 结果以32位整数传输
+        function intToDotted(ip) {
+            return [ip >>> 24, (ip >>> 16) & 255, (ip >>> 8) & 255, ip & 255].join('.');
+        }
+
+        function appendResults(data) {
             const container = document.getElementById('resultsContainer');
 
-            if (results.length === 0) {
+            if (data.ips.length === 0) {
                 return;
             }
 
-            let html = `
-                <table class="results-table">
-                    <thead>
-                        <tr>
-                            <th>#</th>
-                            <th>IP地址</th>
-                            <th>端口</th>
-                            <th>状态</th>
-                            <th>发现时间</th>
-                        </tr>
-                    </thead>
-                    <tbody>
-            `;
-
-            results.forEach((result, index) => {
+            let tbody = container.querySelector('tbody');
+            if (!tbody) {
+                container.innerHTML = `
+                    <table class="results-table">
+                        <thead>
+                            <tr>
+                                <th>#</th>
+                                <th>IP地址</th>
+                                <th>端口</th>
+                                <th>状态</th>
+                                <th>发现时间</th>
+                            </tr>
+                        </thead>
+                        <tbody></tbody>
+                    </table>
+                `;
+                tbody = container.querySelector('tbody');
+            }
+
+            let html = '';
+            data.ips.forEach((ip, index) => {
+                const time = new Date(data.start_ms + data.times[index] * 1000);
                 html += `
                     <tr>
-                        <td>${index + 1}</td>
-                        <td><strong>${result.ip}</strong></td>
-                        <td>${result.port}</td>
-                        <td><span class="status-badge status-open">${result.status}</span></td>
-                        <td>${result.timestamp}</td>
+                        <td>${lastSeen + index + 1}</td>
+                        <td><strong>${typeof ip === 'number' ? intToDotted(ip) : ip}</strong></td>
+                        <td>${data.port}</td>
+                        <td><span class="status-badge status-open">open</span></td>
+                        <td>${time.toLocaleTimeString('zh-CN', {hour12: false})}</td>
                     </tr>
                 `;
             });
 
-            html += `
-                    </tbody>
-                </table>
-            `;
-
-            container.innerHTML = html;
+            tbody.insertAdjacentHTML('beforeend', html);
         }
     </script>
 </body>
 </html>
 """
 
+# 页面中没有模板变量, 启动时编码一次直接返回
+INDEX_PAGE = HTML_TEMPLATE.encode('utf-8')
+
 
 @app.route('/')
 def index():
     """主页"""
-    return render_template_string(HTML_TEMPLATE)
+    response = Response(INDEX_PAGE, mimetype='text/html')
+    response.headers['Cache-Control'] = 'public, max-age=3600'
+    return response
 
 
 @app.route('/api/scan', methods=['POST'])
 def start_scan():
     """启动扫描"""
-    global scan_status
+    global scan_status, cancel_event
 
     if scan_status['is_scanning']:
         return jsonify({'status': 'error', 'message': '扫描正在进行中'})
@@ -519,20 +1019,83 @@ def start_scan():
     data = request.json
     network = data.get('network', '10.16.65.0/24')
     port = data.get('port', 7890)
-    threads = data.get('threads', 50)
+    threads = data.get('threads') or 50
 
-    # 启动后台扫描线程
-    thread = threading.Thread(target=scan_network_thread, args=(network, port, threads))
+    try:
+        network_obj = ipaddress.ip_network(network, strict=False)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': f'网络地址无效: {e}'})
+    if network_obj.num_addresses > MAX_SCAN_ADDRESSES:
+        return jsonify({'status': 'error', 'message': f'网段过大: 最多扫描 {MAX_SCAN_ADDRESSES} 个地址'})
+
+    # 先创建取消事件再置 is_scanning, 此后到达的停止请求一定能拿到新的 cancel_event
+    try:
+        events = mp.Queue()
+        cancel_event = mp.Event()
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': f'无法启动扫描进程: {e}'})
+
+    try:
+        # 在启动扫描前重置状态, 避免重复启动, 也避免第一次状态请求看到上一次的结果
+        reset_scan_state(network_obj, port)
+
+        # 启动扫描进程, 并由后台线程接收它发回的结果
+        process = mp.Process(
+            target=scan_process_main,
+            args=(network_obj, port, threads, counters_shm.name, events, cancel_event, scan_t0),
+            daemon=True
+        )
+        process.start()
+    except Exception as e:
+        # 进程没有启动, 不会有结束事件来清除扫描标志
+        scan_status['is_scanning'] = False
+        return jsonify({'status': 'error', 'message': f'无法启动扫描进程: {e}'})
+
+    thread = threading.Thread(target=relay_scan_events, args=(process, events))
     thread.daemon = True
     thread.start()
 
     return jsonify({'status': 'started', 'message': '扫描已启动'})
 
 
+@app.route('/api/cancel', methods=['POST'])
+def cancel_scan():
+    """停止正在进行的扫描"""
+    if not scan_status['is_scanning']:
+        return jsonify({'status': 'error', 'message': '没有正在进行的扫描'})
+
+    cancel_event.set()
+    return jsonify({'status': 'cancelling', 'message': '正在停止扫描'})
+
+
 @app.route('/api/status', methods=['GET'])
 def get_status():
-    """获取扫描状态"""
-    return jsonify(scan_status)
+    """
+    获取扫描状态, since 为客户端已有的结果数, 只返回之后新增的结果
+    last_scanned 为客户端上次看到的已扫描数, 扫描中且没有新进展时最多等待5秒再返回
+    """
+    since = request.args.get('since', 0, type=int)
+    last_scanned = request.args.get('last_scanned', -1, type=int)
+
+    def unchanged():
+        return (scan_status['is_scanning'] and scan_counters[SCANNED] == last_scanned
+                and len(result_times) == since)
+
+    if unchanged():
+        with scan_progress:
+            scan_progress.wait_for(lambda: not unchanged(), timeout=5)
+
+    count = len(result_times)
+    scanned, total, _ = scan_counters
+    return jsonify({
+        **scan_status,
+        'scanned': scanned,
+        'total': total,
+        'progress': scanned * 100 // total if total else 0,
+        'ips': list(result_ips[since:count]),
+        'times': list(result_times[since:count]),
+        'next_since': max(count, since)
+    })
 
 
 if __name__ == '__main__':
@@ -541,5 +1104,11 @@ if __name__ == '__main__':
     print("=" * 60)
     print("服务启动在: http://localhost:5002")
     print("请在浏览器中打开上述地址")
+    print("也可使用 gunicorn 部署 (扫描状态在进程内, 只用一个worker):")
+    print("  gunicorn -k gthread --threads 8 -b 0.0.0.0:5002 scanner_web:app")
     print("=" * 60)
-    app.run(host='0.0.0.0', port=5002, debug=True)
\ No newline at end of file
+
+    # 使用多线程 WSGI 服务器, 状态轮询不会被扫描线程阻塞
+    from waitress import serve
+    app.debug = False
+    serve(app, host='0.0.0.0', port=5002, threads=8)
\ No newline at end of file